@@ -10,6 +10,10 @@
 from datadog_checks.base.utils.models.fields import get_default_field_value
 
 
+def shared_connection_pooling(field, value):
+    return False
+
+
 def shared_custom_metrics(field, value):
     return get_default_field_value(field, value)
 
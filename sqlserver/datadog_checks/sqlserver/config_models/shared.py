@@ -23,6 +23,7 @@ class SharedConfig(BaseModel):
     class Config:
         allow_mutation = False
 
+    connection_pooling: Optional[bool]
     custom_metrics: Optional[Sequence[Mapping[str, Any]]]
     global_custom_queries: Optional[Sequence[Mapping[str, Any]]]
     service: Optional[str]
@@ -2,12 +2,16 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import logging
+import re
 import socket
+import threading
+from concurrent.futures.thread import ThreadPoolExecutor
 from contextlib import closing, contextmanager
 
+from cachetools import TTLCache
 from six import raise_from
 
-from datadog_checks.base import AgentCheck, ConfigurationError
+from datadog_checks.base import AgentCheck, ConfigurationError, is_affirmative
 from datadog_checks.base.log import get_check_logger
 
 try:
@@ -26,6 +30,18 @@ logger = logging.getLogger(__file__)
 
 DATABASE_EXISTS_QUERY = 'select name, collation_name from sys.databases;'
 DEFAULT_CONN_PORT = 1433
+DATABASE_LIST_CACHE_TTL = 300
+
+# the list of databases of a server rarely changes, so it is shared by all the connections using the same
+# connection parameters and only refreshed once it expires or a configured database could not be found in it
+_database_list_cache = TTLCache(maxsize=1000, ttl=DATABASE_LIST_CACHE_TTL)
+_database_list_cache_lock = threading.Lock()
+
+# resolved addresses used to test the network connectivity, so that the repeated connection failures of an outage
+# don't trigger a DNS lookup each time
+ADDRESS_CACHE_TTL = 60
+_address_cache = TTLCache(maxsize=1000, ttl=ADDRESS_CACHE_TTL)
+_address_cache_lock = threading.Lock()
 
 
 class SQLConnectionError(Exception):
@@ -40,13 +56,13 @@ def split_sqlserver_host_port(host):
     """
     if not host:
         return host, None
-    host_split = [s.strip() for s in host.split(',')]
-    if len(host_split) == 1:
-        return host_split[0], None
-    if len(host_split) == 2:
-        return host_split
-    # else len > 2
-    s_host, s_port = host_split[0:2]
+    s_host, sep, s_port = host.partition(',')
+    if not sep:
+        return s_host.strip(), None
+    if ',' not in s_port:
+        return s_host.strip(), s_port.strip()
+    # else there is more than one comma
+    s_host, s_port = s_host.strip(), s_port.partition(',')[0].strip()
     logger.warning(
         "invalid sqlserver host string has more than one comma: %s. using only 1st two items: host:%s, port:%s",
         host,
@@ -56,9 +72,26 @@ def split_sqlserver_host_port(host):
     return s_host, s_port
 
 
+def _resolve_address(host, port):
+    """
+    Returns the getaddrinfo entries of all the addresses (IPv4 and IPv6) of the given host and port, resolving them
+    unless a previous result is still cached.
+    """
+    key = (host, port)
+    with _address_cache_lock:
+        addrinfo = _address_cache.get(key)
+    if addrinfo is None:
+        addrinfo = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with _address_cache_lock:
+            _address_cache[key] = addrinfo
+    return addrinfo
+
+
 # we're only including the bare minimum set of special characters required to parse the connection string while
-# supporting escaping using braces, letting the client library or the database ultimately decide what's valid
-CONNECTION_STRING_SPECIAL_CHARACTERS = set('=;{}')
+# supporting escaping using braces, letting the client library or the database ultimately decide what's valid.
+# Each match is one of: a brace-escaped run (group 1), a run of regular characters (group 2) or a single special
+# character (group 3)
+_CS_TOKEN = re.compile(r'\{((?:[^}]|\}\})*)\}|([^=;{}]+)|([=;{}])')
 
 
 def parse_connection_string_properties(cs):
@@ -70,64 +103,57 @@ def parse_connection_string_properties(cs):
     """
     cs = cs.strip()
     params = {}
-    i = 0
-    escaping = False
-    key, parsed, key_done = "", "", False
-    while i < len(cs):
-        if escaping:
-            if cs[i : i + 2] == '}}':
-                parsed += '}'
-                i += 2
-                continue
-            if cs[i] == '}':
-                escaping = False
-                i += 1
-                continue
-            parsed += cs[i]
-            i += 1
-            continue
-        if cs[i] == '{':
-            escaping = True
-            i += 1
+    key, parts, key_done = "", [], False
+    escaped_end = -1
+    for m in _CS_TOKEN.finditer(cs):
+        escaped, run, special = m.groups()
+        if escaped is not None:
+            if escaped:
+                parts.append(escaped.replace('}}', '}'))
+            escaped_end = m.end()
             continue
-        # ignore leading whitespace, i.e. between two keys "A=B;  C=D"
-        if not key_done and not parsed and cs[i] == ' ':
-            i += 1
+        if run is not None:
+            # ignore leading whitespace, i.e. between two keys "A=B;  C=D"
+            if not key_done and not parts:
+                run = run.lstrip(' ')
+                if not run:
+                    continue
+            parts.append(run)
             continue
-        if cs[i] == '=':
+        i = m.start()
+        if special == '=':
             if key_done:
                 raise ConfigurationError(
                     "Invalid connection string: unexpected '=' while parsing value at index={}: {}".format(i, cs)
                 )
-            key, parsed, key_done = parsed, "", True
+            key, parts, key_done = ''.join(parts), [], True
             if not key:
                 raise ConfigurationError("Invalid connection string: empty key at index={}: {}".format(i, cs))
-            i += 1
             continue
-        if cs[i] == ';':
-            if not parsed:
+        if special == ';':
+            value = ''.join(parts)
+            if not value:
                 raise ConfigurationError("Invalid connection string: empty value at index={}: {}".format(i, cs))
-            params[key] = parsed
-            key, parsed, key_done = "", "", False
-            i += 1
+            params[key] = value
+            key, parts, key_done = "", [], False
             continue
-        if cs[i] in CONNECTION_STRING_SPECIAL_CHARACTERS:
+        if special == '{' or (special == '}' and i == escaped_end):
+            # an opening brace only fails to match as an escaped run if it is never closed, and a closing brace right
+            # after an escaped run means the run was cut short of a '}}' escape as no closing brace follows it
             raise ConfigurationError(
-                "Invalid connection string: invalid character '{}' at index={}: {}".format(cs[i], i, cs)
+                "Invalid connection string: did not find expected matching closing brace '}}': {}".format(cs)
             )
-        parsed += cs[i]
-        i += 1
-    # the last ';' can be omitted so check for a final remaining param here
-    if escaping:
         raise ConfigurationError(
-            "Invalid connection string: did not find expected matching closing brace '}}': {}".format(cs)
+            "Invalid connection string: invalid character '{}' at index={}: {}".format(special, i, cs)
         )
+    # the last ';' can be omitted so check for a final remaining param here
     if key:
-        if not parsed:
+        value = ''.join(parts)
+        if not value:
             raise ConfigurationError(
                 "Invalid connection string: empty value at the end of the connection string: {}".format(cs)
             )
-        params[key] = parsed
+        params[key] = value
     return params
 
 
@@ -141,29 +167,45 @@ known_hresult_codes = {
 }
 
 
-def _format_connection_exception(e):
+def _format_exception(e, redact=()):
+    """
+    Formats the provided database connection exception.
+    Any of the `redact` values (i.e. the password) found in the message is masked.
+    """
+    message = repr(e)
+    for value in redact:
+        if value:
+            message = message.replace(value, "*" * 6)
+    return message
+
+
+def _format_ado_exception(e, redact=()):
     """
     Formats the provided database connection exception.
     If the exception comes from an ADO Provider and contains a misleading 'Invalid connection string attribute' message
     then the message is replaced with more descriptive messages based on the contained HResult error codes.
+    Any of the `redact` values (i.e. the password) found in the message is masked.
     """
-    if adodbapi is not None:
-        if isinstance(e, OperationalError) and e.args and isinstance(e.args[0], com_error):
-            e_comm = e.args[0]
-            hresult = e_comm.hresult
-            sub_hresult = None
-            internal_message = None
-            if e_comm.args and len(e_comm.args) == 4:
-                internal_args = e_comm.args[2]
-                if len(internal_args) == 6:
-                    internal_message = internal_args[2]
-                    sub_hresult = internal_args[5]
-            if internal_message == 'Invalid connection string attribute':
-                base_message = known_hresult_codes.get(hresult)
-                sub_message = known_hresult_codes.get(sub_hresult)
-                if base_message and sub_message:
-                    return base_message + ": " + sub_message
-    return repr(e)
+    if isinstance(e, OperationalError) and e.args and isinstance(e.args[0], com_error):
+        e_comm = e.args[0]
+        hresult = e_comm.hresult
+        sub_hresult = None
+        internal_message = None
+        if e_comm.args and len(e_comm.args) == 4:
+            internal_args = e_comm.args[2]
+            if len(internal_args) == 6:
+                internal_message = internal_args[2]
+                sub_hresult = internal_args[5]
+        if internal_message == 'Invalid connection string attribute':
+            base_message = known_hresult_codes.get(hresult)
+            sub_message = known_hresult_codes.get(sub_hresult)
+            if base_message and sub_message:
+                return base_message + ": " + sub_message
+    return _format_exception(e, redact)
+
+
+# ADO exceptions can only be raised when adodbapi is installed
+_format_connection_exception = _format_ado_exception if adodbapi is not None else _format_exception
 
 
 class Connection(object):
@@ -177,9 +219,39 @@ class Connection(object):
     SQLSERVER_2014 = 2014
     PROC_GUARD_DB_KEY = 'proc_only_if_database'
 
+    # connection string options holding the password, for both connectors
+    _PASSWORD_OPTIONS = frozenset(['pwd', 'password'])
+
     valid_adoproviders = ['SQLOLEDB', 'MSOLEDBSQL', 'MSOLEDBSQL19', 'SQLNCLI11']
     default_adoprovider = 'SQLOLEDB'
 
+    # connection string options of each connector which can also be set with an instance config option. The option
+    # holding the database name is kept apart since it maps to the db_key/db_name being connected to
+    _ADODBAPI_OPTIONS = {
+        'PROVIDER': 'adoprovider',
+        'Data Source': 'host',
+        'User ID': 'username',
+        'Password': 'password',
+    }
+    _ADODBAPI_DATABASE_OPTION = 'Initial Catalog'
+    _ODBC_OPTIONS = {
+        'DSN': 'dsn',
+        'DRIVER': 'driver',
+        'SERVER': 'host',
+        'UID': 'username',
+        'PWD': 'password',
+    }
+    _ODBC_DATABASE_OPTION = 'DATABASE'
+    # the same options by lowercased name as connection string keys are case-insensitive, along with their
+    # original name (and config option, except for the database one)
+    _ADODBAPI_LOWERCASED_OPTIONS = {k.lower(): (k, v) for k, v in _ADODBAPI_OPTIONS.items()}
+    _ADODBAPI_LOWERCASED_OPTIONS[_ADODBAPI_DATABASE_OPTION.lower()] = (_ADODBAPI_DATABASE_OPTION, None)
+    _ODBC_LOWERCASED_OPTIONS = {k.lower(): (k, v) for k, v in _ODBC_OPTIONS.items()}
+    _ODBC_LOWERCASED_OPTIONS[_ODBC_DATABASE_OPTION.lower()] = (_ODBC_DATABASE_OPTION, None)
+    # instance config options which are ignored when the other connector is used
+    _ADODBAPI_ONLY_CONFIG_OPTIONS = frozenset(_ADODBAPI_OPTIONS.values()) - frozenset(_ODBC_OPTIONS.values())
+    _ODBC_ONLY_CONFIG_OPTIONS = frozenset(_ODBC_OPTIONS.values()) - frozenset(_ADODBAPI_OPTIONS.values())
+
     def __init__(self, init_config, instance_config, service_check_handler):
         self.instance = instance_config
         self.service_check_handler = service_check_handler
@@ -187,7 +259,30 @@ class Connection(object):
 
         # mapping of raw connections based on conn_key to different databases
         self._conns = {}
+        # cursor reused by all the queries run on each raw connection, as (raw connection, cursor) based on conn_key
+        self._cursors = {}
+        # the instance config doesn't change over the lifetime of the connection, so the access info and connection
+        # keys derived from it are computed once per (db_key, db_name) and reused on every call
+        self._access_info_cache = {}
+        self._conn_key_cache = {}
+        self._host_with_port = None
+        # connection strings built by _conn_string_odbc/_conn_string_adodbapi, keyed by (db_key, db_name). They
+        # embed the password, so they are kept on the connection instance and never shared
+        self._conn_str_cache = {}
+        # (host, port) used by test_network_connectivity, resolved from the config on first use
+        self._network_address = None
+        # (db_key, db_name) pairs whose connection options have already been validated
+        self._validated_connection_options = set()
+        # idle raw connections kept open across check runs when connection pooling is enabled, keyed by conn_key.
+        # Closing a connection through close_db_connections hands it back here so the next open_db_connections can
+        # skip the connection handshake
+        self._pool = {}
+        self._pooling = is_affirmative(init_config.get('connection_pooling', False))
+        # the DBM jobs open and close their connections from their own threads
+        self._pool_lock = threading.Lock()
+        self._prewarm_threads = []
         self.timeout = int(self.instance.get('command_timeout', self.DEFAULT_COMMAND_TIMEOUT))
+        # (exact names of all databases, lowercased names of the case-insensitive databases)
         self.existing_databases = None
         self.server_version = int(self.instance.get('server_version', self.DEFAULT_SQLSERVER_VERSION))
 
@@ -233,7 +328,8 @@ class Connection(object):
     def get_cursor(self, db_key, db_name=None, key_prefix=None):
         """
         Return a cursor to execute query against the db
-        Cursor are cached in the self.connections dict
+        Cursors are cached per connection in the self._cursors dict and are only closed once their connection
+        is released
         """
         conn_key = self._conn_key(db_key, db_name, key_prefix)
         try:
@@ -243,14 +339,22 @@ class Connection(object):
             # FIXME: we should find a better way to compute unique keys to map opened connections other than
             # using auth info in clear text!
             raise SQLConnectionError("Cannot find an opened connection for host: {}".format(self.instance.get('host')))
-        return conn.cursor()
+        cached = self._cursors.get(conn_key)
+        if cached is not None and cached[0] is conn:
+            return cached[1]
+        cursor = conn.cursor()
+        self._cursors[conn_key] = (conn, cursor)
+        return cursor
 
     def close_cursor(self, cursor):
         """
-        We close the cursor explicitly b/c we had proven memory leaks
+        Cursors returned by get_cursor are reused by the following queries, so they are left open until their connection
+        is released. Any other cursor is closed explicitly b/c we had proven memory leaks
         We handle any exception from closing, although according to the doc:
         "in adodbapi, it is NOT an error to re-close a closed cursor"
         """
+        if any(cached is cursor for _, cached in list(self._cursors.values())):
+            return
         try:
             cursor.close()
         except Exception as e:
@@ -264,11 +368,12 @@ class Connection(object):
 
     def check_database_conns(self, db_name):
         self.open_db_connections(None, db_name=db_name, is_default=False)
-        self.close_db_connections(None, db_name)
+        self.close_db_connections(None, db_name, pooled=False)
 
     @contextmanager
     def open_managed_default_database(self):
-        with self._open_managed_db_connections(None, db_name=self.DEFAULT_DATABASE):
+        # this connection is only used while initializing the check, so it is closed rather than kept in the pool
+        with self._open_managed_db_connections(None, db_name=self.DEFAULT_DATABASE, pooled=False):
             yield
 
     @contextmanager
@@ -277,12 +382,12 @@ class Connection(object):
             yield
 
     @contextmanager
-    def _open_managed_db_connections(self, db_key, db_name=None, key_prefix=None):
+    def _open_managed_db_connections(self, db_key, db_name=None, key_prefix=None, pooled=True):
         self.open_db_connections(db_key, db_name, key_prefix=key_prefix)
         try:
             yield
         finally:
-            self.close_db_connections(db_key, db_name, key_prefix=key_prefix)
+            self.close_db_connections(db_key, db_name, key_prefix=key_prefix, pooled=pooled)
 
     def open_db_connections(self, db_key, db_name=None, is_default=True, key_prefix=None):
         """
@@ -290,25 +395,20 @@ class Connection(object):
         before we use them, and are closable, once we are finished. Open db
         connections keep locks on the db, presenting issues such as the SQL
         Server Agent being unable to stop.
+
+        With connection pooling enabled, the idle connection left in the pool
+        by close_db_connections is reused unless is_default is False.
         """
         conn_key = self._conn_key(db_key, db_name, key_prefix)
 
         _, host, _, _, database, _ = self._get_access_info(db_key, db_name)
 
-        cs = self.instance.get('connection_string', '')
-        cs += ';' if cs != '' else ''
-
-        self._connection_options_validation(db_key, db_name)
+        self._validate_connection_options_once(db_key, db_name)
 
         try:
-            if self.connector == 'adodbapi':
-                cs += self._conn_string_adodbapi(db_key, db_name=db_name)
-                # autocommit: true disables implicit transaction
-                rawconn = adodbapi.connect(cs, {'timeout': self.timeout, 'autocommit': True})
-            else:
-                cs += self._conn_string_odbc(db_key, db_name=db_name)
-                rawconn = pyodbc.connect(cs, timeout=self.timeout, autocommit=True)
-                rawconn.timeout = self.timeout
+            rawconn = self._borrow_pooled_connection(conn_key, database) if is_default else None
+            if rawconn is None:
+                rawconn = self._new_connection(db_key, db_name)
 
             self.service_check_handler(AgentCheck.OK, host, database, is_default=is_default)
             if conn_key not in self._conns:
@@ -321,45 +421,183 @@ class Connection(object):
                     self.log.info("Could not close adodbapi db connection\n%s", e)
 
                 self._conns[conn_key] = rawconn
-            self._setup_new_connection(rawconn)
         except Exception as e:
             error_message = self.test_network_connectivity()
             tcp_connection_status = error_message if error_message else "OK"
+            formatted_exception = _format_connection_exception(e, redact=(self.instance.get('password'),))
             message = "Unable to connect to SQL Server (host={} database={}). TCP-connection({}). Exception: {}".format(
-                host, database, tcp_connection_status, _format_connection_exception(e)
+                host, database, tcp_connection_status, formatted_exception
             )
 
-            password = self.instance.get('password')
-            if password is not None:
-                message = message.replace(password, "*" * 6)
-
             self.service_check_handler(AgentCheck.CRITICAL, host, database, message, is_default=is_default)
 
             # Only raise exception on the default instance database
             if is_default:
                 raise_from(SQLConnectionError(message), None)
 
+    def _new_connection(self, db_key, db_name=None):
+        """Open a new raw connection, ready to be used"""
+        cs = self.instance.get('connection_string', '')
+        cs += ';' if cs != '' else ''
+
+        if self.connector == 'adodbapi':
+            cs += self._conn_string_adodbapi(db_key, db_name=db_name)
+            # autocommit: true disables implicit transaction
+            rawconn = adodbapi.connect(cs, {'timeout': self.timeout, 'autocommit': True})
+        else:
+            cs += self._conn_string_odbc(db_key, db_name=db_name)
+            rawconn = pyodbc.connect(cs, timeout=self.timeout, autocommit=True)
+            rawconn.timeout = self.timeout
+
+        try:
+            self._setup_new_connection(rawconn)
+        except Exception:
+            self._close_raw_connection(rawconn)
+            raise
+        return rawconn
+
+    def prewarm_pool(self, key_prefixes):
+        """
+        Open a connection to the default database for each of the given key prefixes in the background and add it to
+        the pool, so that the first check run borrows them instead of waiting on each connection handshake in turn.
+        Nothing waits on them: until one is ready, or if it fails, its user simply opens its own connection.
+        """
+        if not self._pooling or not key_prefixes:
+            return
+        try:
+            self._validate_connection_options_once(self.DEFAULT_DB_KEY, None)
+        except ConfigurationError:
+            # the invalid configuration is reported by open_db_connections
+            return
+        for key_prefix in key_prefixes:
+            # daemon threads, so that a connection attempt to an unreachable host never holds up the agent's exit
+            thread = threading.Thread(target=self._prewarm_connection, args=(key_prefix,), name='sqlserver-prewarm')
+            thread.daemon = True
+            thread.start()
+            self._prewarm_threads.append(thread)
+
+    def _prewarm_connection(self, key_prefix):
+        conn_key = self._conn_key(self.DEFAULT_DB_KEY, key_prefix=key_prefix)
+        try:
+            rawconn = self._new_connection(self.DEFAULT_DB_KEY)
+        except Exception as e:
+            # connection errors are reported by open_db_connections once the connection is actually used
+            self.log.debug(
+                "Could not open a connection to prewarm the pool: %s",
+                _format_connection_exception(e, redact=(self.instance.get('password'),)),
+            )
+            return
+        with self._pool_lock:
+            if self._pooling and conn_key not in self._pool:
+                self._pool[conn_key] = rawconn
+                return
+        # the check already has its own connection or the pool has been closed in the meantime
+        self._close_raw_connection(rawconn)
+
     def _setup_new_connection(self, rawconn):
+        # ensure that by default, the agent's reads can never block updates to any tables it's reading from
+        if self.connector == 'odbc':
+            # setting the isolation level as a connection attribute spares a round-trip to the server
+            rawconn.set_attr(pyodbc.SQL_ATTR_TXN_ISOLATION, pyodbc.SQL_TXN_READ_UNCOMMITTED)
+            return
+        # ADO only applies its IsolationLevel property to explicit transactions, so with autocommit the statement
+        # has to be run on the session
         with rawconn.cursor() as cursor:
-            # ensure that by default, the agent's reads can never block updates to any tables it's reading from
             cursor.execute("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED")
 
-    def close_db_connections(self, db_key, db_name=None, key_prefix=None):
+    def _borrow_pooled_connection(self, conn_key, database):
+        """
+        Return the idle connection kept in the pool for conn_key, or None if there is none or it is no longer usable.
+        The previous run may have switched the session to another database, i.e. with a USE from a custom query, so
+        the database context is reset, which also makes sure that the connection is still alive.
+        """
+        with self._pool_lock:
+            rawconn = self._pool.pop(conn_key, None)
+        if rawconn is None:
+            return None
+        try:
+            with rawconn.cursor() as cursor:
+                if database:
+                    cursor.execute("USE [{}]".format(database.replace(']', ']]')))
+                else:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchall()
+            return rawconn
+        except Exception as e:
+            self.log.debug("Discarding pooled db connection which is no longer usable: %s", e)
+            try:
+                rawconn.close()
+            except Exception as e:
+                self.log.debug("Could not close pooled db connection\n%s", e)
+        return None
+
+    def close_db_connections(self, db_key, db_name=None, key_prefix=None, pooled=True):
         """
         We close the db connections explicitly b/c when we don't they keep
         locks on the db. This presents as issues such as the SQL Server Agent
         being unable to stop.
+
+        With connection pooling enabled, a pooled connection is instead handed
+        back to the pool, so its session keeps its shared lock on the db until
+        the connection is reused or the pool is closed.
         """
         conn_key = self._conn_key(db_key, db_name, key_prefix)
         if conn_key not in self._conns:
             return
 
+        # the reused cursor may still hold pending results, i.e. from a fetchone(), which would keep the connection
+        # busy, so it is closed before the connection is closed or handed back to the pool
+        cached = self._cursors.pop(conn_key, None)
+        if cached is not None:
+            try:
+                cached[1].close()
+            except Exception as e:
+                self.log.debug("Could not close db cursor\n%s", e)
+
+        if pooled:
+            with self._pool_lock:
+                if self._pooling and conn_key not in self._pool:
+                    self._pool[conn_key] = self._conns.pop(conn_key)
+                    return
+
         try:
             self._conns[conn_key].close()
             del self._conns[conn_key]
         except Exception as e:
             self.log.warning("Could not close adodbapi db connection\n%s", e)
 
+    def close_pooled_connections(self):
+        """Close all the idle connections kept in the pool"""
+        with self._pool_lock:
+            rawconns = list(self._pool.values())
+            self._pool.clear()
+        self._close_raw_connections(rawconns)
+
+    def close_pool(self):
+        """
+        Close all the idle connections kept in the pool and stop pooling. The connections still in use, i.e. by the
+        DBM jobs or a prewarm, are left alone and get closed once they are released.
+        """
+        with self._pool_lock:
+            self._pooling = False
+        self.close_pooled_connections()
+
+    def _close_raw_connections(self, rawconns):
+        """
+        Closing a connection waits on a round-trip to the server, so the connections are closed concurrently
+        """
+        if not rawconns:
+            return
+        with ThreadPoolExecutor(max_workers=min(16, len(rawconns))) as executor:
+            for _ in executor.map(self._close_raw_connection, rawconns):
+                pass
+
+    def _close_raw_connection(self, rawconn):
+        try:
+            rawconn.close()
+        except Exception as e:
+            self.log.warning("Could not close db connection\n%s", e)
+
     def _check_db_exists(self):
         """
         Check for existence of a database, but take into consideration whether the db is case-sensitive or not.
@@ -373,19 +611,22 @@ class Connection(object):
 
         _, host, _, _, database, _ = self._get_access_info(self.DEFAULT_DB_KEY)
         context = "{} - {}".format(host, database)
+        cache_key = self._database_list_cache_key()
+        if self.existing_databases is None:
+            with _database_list_cache_lock:
+                self.existing_databases = _database_list_cache.get(cache_key)
         if self.existing_databases is None:
             cursor = self.get_cursor(None, self.DEFAULT_DATABASE)
 
             try:
-                self.existing_databases = {}
                 cursor.execute(DATABASE_EXISTS_QUERY)
-                for row in cursor:
+                # rows are (name, collation_name)
+                rows = cursor.fetchall()
+                existing_databases = (
+                    {row[0] for row in rows},
                     # collation_name can be NULL if db offline, in that case assume its case_insensitive
-                    case_insensitive = not row.collation_name or 'CI' in row.collation_name
-                    self.existing_databases[row.name.lower()] = (
-                        case_insensitive,
-                        row.name,
-                    )
+                    {row[0].lower() for row in rows if not row[1] or 'CI' in row[1]},
+                )
 
             except Exception as e:
                 self.log.error("Failed to check if database %s exists: %s", database, e)
@@ -393,14 +634,39 @@ class Connection(object):
             finally:
                 self.close_cursor(cursor)
 
-        exists = False
-        if database.lower() in self.existing_databases:
-            case_insensitive, cased_name = self.existing_databases[database.lower()]
-            if case_insensitive or database == cased_name:
-                exists = True
+            self.existing_databases = existing_databases
+            with _database_list_cache_lock:
+                _database_list_cache[cache_key] = existing_databases
+
+        names, ci_names = self.existing_databases
+        exists = database in names or database.lower() in ci_names
+
+        if not exists:
+            # make sure a database created in the meantime is picked up the next time this is checked
+            with _database_list_cache_lock:
+                _database_list_cache.pop(cache_key, None)
 
         return exists, context
 
+    def _database_list_cache_key(self):
+        """
+        Return the key identifying the server in the module level database list cache. The cache is shared by all the
+        instances, so unlike the connection keys it must not contain the password.
+        """
+        dsn, host, username, _, _, _ = self._get_access_info(None, self.DEFAULT_DATABASE)
+        # the server may only be named in the connection string, i.e. when host is not set
+        cs_properties = ()
+        cs = self.instance.get('connection_string')
+        if cs:
+            cs_properties = tuple(
+                sorted(
+                    (k.lower(), v)
+                    for k, v in parse_connection_string_properties(cs).items()
+                    if k.lower() not in self._PASSWORD_OPTIONS
+                )
+            )
+        return dsn, host, username, cs_properties
+
     def get_connector(self):
         connector = self.instance.get('connector', self.default_connector)
         if connector != self.default_connector:
@@ -439,6 +705,11 @@ class Connection(object):
 
     def _get_access_info(self, db_key, db_name=None):
         """Convenience method to extract info from instance"""
+        cache_key = (db_key, db_name)
+        access_info = self._access_info_cache.get(cache_key)
+        if access_info is not None:
+            return access_info
+
         dsn = self.instance.get('dsn')
         username = self.instance.get('username')
         password = self.instance.get('password')
@@ -462,7 +733,9 @@ class Connection(object):
                     self.DEFAULT_DRIVER,
                 )
                 driver = self.DEFAULT_DRIVER
-        return dsn, host, username, password, database, driver
+        access_info = dsn, host, username, password, database, driver
+        self._access_info_cache[cache_key] = access_info
+        return access_info
 
     def _get_host_with_port(self):
         """Return a string with format host,port.
@@ -470,6 +743,9 @@ class Connection(object):
         If not, any port provided as a separate port config option is used.
         If the port is misconfigured or missing, default port is used.
         """
+        if self._host_with_port is not None:
+            return self._host_with_port
+
         host = self.instance.get("host")
         if not host:
             return None
@@ -488,56 +764,49 @@ class Connection(object):
             self.log.warning("Invalid port %s; falling back to default 1433", port)
             port = str(DEFAULT_CONN_PORT)
 
-        return split_host + "," + port
+        self._host_with_port = split_host + "," + port
+        return self._host_with_port
 
     def _conn_key(self, db_key, db_name=None, key_prefix=None):
         """Return a key to use for the connection cache"""
+        cache_key = (db_key, db_name, key_prefix)
+        conn_key = self._conn_key_cache.get(cache_key)
+        if conn_key is not None:
+            return conn_key
+
         dsn, host, username, password, database, driver = self._get_access_info(db_key, db_name)
-        if not key_prefix:
-            key_prefix = ""
-        return '{}{}:{}:{}:{}:{}:{}'.format(key_prefix, dsn, host, username, password, database, driver)
+        conn_key = (key_prefix or "", dsn, host, username, password, database, driver)
+        self._conn_key_cache[cache_key] = conn_key
+        return conn_key
+
+    def _validate_connection_options_once(self, db_key, db_name):
+        if (db_key, db_name) not in self._validated_connection_options:
+            self._connection_options_validation(db_key, db_name)
+            self._validated_connection_options.add((db_key, db_name))
 
     def _connection_options_validation(self, db_key, db_name):
         cs = self.instance.get('connection_string')
         username = self.instance.get('username')
         password = self.instance.get('password')
 
-        adodbapi_options = {
-            'PROVIDER': 'adoprovider',
-            'Data Source': 'host',
-            'Initial Catalog': db_name or db_key,
-            'User ID': 'username',
-            'Password': 'password',
-        }
-        odbc_options = {
-            'DSN': 'dsn',
-            'DRIVER': 'driver',
-            'SERVER': 'host',
-            'DATABASE': db_name or db_key,
-            'UID': 'username',
-            'PWD': 'password',
-        }
-
         if self.connector == 'adodbapi':
             other_connector = 'odbc'
-            connector_options = adodbapi_options
-            other_connector_options = odbc_options
-
+            connector_options = self._ADODBAPI_LOWERCASED_OPTIONS
+            other_connector_options = self._ODBC_LOWERCASED_OPTIONS
+            ignored_options = self._ODBC_ONLY_CONFIG_OPTIONS
         else:
             other_connector = 'adodbapi'
-            connector_options = odbc_options
-            other_connector_options = adodbapi_options
-
-        for option in {
-            value
-            for key, value in other_connector_options.items()
-            if value not in connector_options.values() and self.instance.get(value) is not None
-        }:
-            self.log.warning(
-                "%s option will be ignored since %s connection is used",
-                option,
-                self.connector,
-            )
+            connector_options = self._ODBC_LOWERCASED_OPTIONS
+            other_connector_options = self._ADODBAPI_LOWERCASED_OPTIONS
+            ignored_options = self._ADODBAPI_ONLY_CONFIG_OPTIONS
+
+        for option in ignored_options:
+            if self.instance.get(option) is not None:
+                self.log.warning(
+                    "%s option will be ignored since %s connection is used",
+                    option,
+                    self.connector,
+                )
 
         if cs is None:
             return
@@ -551,68 +820,82 @@ class Connection(object):
         } and (username or password):
             self.log.warning("Username and password are ignored when using Windows authentication")
 
-        for key, value in connector_options.items():
-            if key.lower() in lowercased_keys_cs and self.instance.get(value) is not None:
-                raise ConfigurationError(
-                    "%s has been provided both in the connection string and as a "
-                    "configuration option (%s), please specify it only once" % (key, value)
-                )
-        for key in other_connector_options.keys():
-            if key.lower() in lowercased_keys_cs:
+        for lowercased_key in lowercased_keys_cs:
+            if lowercased_key in connector_options:
+                key, value = connector_options[lowercased_key]
+                if value is None:
+                    value = db_name or db_key
+                if self.instance.get(value) is not None:
+                    raise ConfigurationError(
+                        "%s has been provided both in the connection string and as a "
+                        "configuration option (%s), please specify it only once" % (key, value)
+                    )
+            elif lowercased_key in other_connector_options:
+                key, _ = other_connector_options[lowercased_key]
                 raise ConfigurationError(
                     "%s has been provided in the connection string. "
                     "This option is only available for %s connections,"
                     " however %s has been selected" % (key, other_connector, self.connector)
                 )
 
-    def _conn_string_odbc(self, db_key, conn_key=None, db_name=None):
+    def _conn_string_odbc(self, db_key, db_name=None):
         """Return a connection string to use with odbc"""
-        if conn_key:
-            dsn, host, username, password, database, driver = conn_key.split(":")
-        else:
-            dsn, host, username, password, database, driver = self._get_access_info(db_key, db_name)
+        cache_key = (db_key, db_name)
+        conn_str = self._conn_str_cache.get(cache_key)
+        if conn_str is not None:
+            return conn_str
+
+        dsn, host, username, password, database, driver = self._get_access_info(db_key, db_name)
 
         # The connection resiliency feature is supported on Microsoft Azure SQL Database
         # and SQL Server 2014 (and later) server versions. See the SQLServer docs for more information
         # https://docs.microsoft.com/en-us/sql/connect/odbc/connection-resiliency?view=sql-server-ver15
-        conn_str = ''
+        parts = []
         if self.server_version >= self.SQLSERVER_2014:
-            conn_str += 'ConnectRetryCount=2;'
+            parts.append('ConnectRetryCount=2;')
         if dsn:
-            conn_str += 'DSN={};'.format(dsn)
+            parts.append('DSN={};'.format(dsn))
         if driver:
-            conn_str += 'DRIVER={};'.format(driver)
+            parts.append('DRIVER={};'.format(driver))
         if host:
-            conn_str += 'Server={};'.format(host)
+            parts.append('Server={};'.format(host))
         if database:
-            conn_str += 'Database={};'.format(database)
+            parts.append('Database={};'.format(database))
         if username:
-            conn_str += 'UID={};'.format(username)
-        self.log.debug("Connection string (before password) %s", conn_str)
+            parts.append('UID={};'.format(username))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Connection string (before password) %s", ''.join(parts))
         if password:
-            conn_str += 'PWD={};'.format(password)
+            parts.append('PWD={};'.format(password))
+        conn_str = ''.join(parts)
+        self._conn_str_cache[cache_key] = conn_str
         return conn_str
 
-    def _conn_string_adodbapi(self, db_key, conn_key=None, db_name=None):
+    def _conn_string_adodbapi(self, db_key, db_name=None):
         """Return a connection string to use with adodbapi"""
-        if conn_key:
-            _, host, username, password, database, _ = conn_key.split(":")
-        else:
-            _, host, username, password, database, _ = self._get_access_info(db_key, db_name)
+        cache_key = (db_key, db_name)
+        conn_str = self._conn_str_cache.get(cache_key)
+        if conn_str is not None:
+            return conn_str
+
+        _, host, username, password, database, _ = self._get_access_info(db_key, db_name)
 
         provider = self._get_adoprovider()
-        retry_conn_count = ''
+        parts = []
         if self.server_version >= self.SQLSERVER_2014:
-            retry_conn_count = 'ConnectRetryCount=2;'
-        conn_str = '{}Provider={};Data Source={};Initial Catalog={};'.format(retry_conn_count, provider, host, database)
+            parts.append('ConnectRetryCount=2;')
+        parts.append('Provider={};Data Source={};Initial Catalog={};'.format(provider, host, database))
 
         if username:
-            conn_str += 'User ID={};'.format(username)
-        self.log.debug("Connection string (before password) %s", conn_str)
+            parts.append('User ID={};'.format(username))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Connection string (before password) %s", ''.join(parts))
         if password:
-            conn_str += 'Password={};'.format(password)
+            parts.append('Password={};'.format(password))
         if not username and not password:
-            conn_str += 'Integrated Security=SSPI;'
+            parts.append('Integrated Security=SSPI;')
+        conn_str = ''.join(parts)
+        self._conn_str_cache[cache_key] = conn_str
         return conn_str
 
     def test_network_connectivity(self):
@@ -622,23 +905,38 @@ class Connection(object):
 
         :return: error_message if failed connection else None
         """
-        host, port = split_sqlserver_host_port(self.instance.get('host'))
-        if port is None:
-            port = DEFAULT_CONN_PORT
-            provided_port = self.instance.get("port")
-            if provided_port is not None:
-                port = provided_port
+        if self._network_address is None:
+            host, port = split_sqlserver_host_port(self.instance.get('host'))
+            if port is None:
+                port = DEFAULT_CONN_PORT
+                provided_port = self.instance.get("port")
+                if provided_port is not None:
+                    port = provided_port
+
+            try:
+                port = int(port)
+            except ValueError as e:
+                return "ERROR: invalid port: {}".format(repr(e))
+            self._network_address = host, port
+        host, port = self._network_address
 
         try:
-            port = int(port)
-        except ValueError as e:
-            return "ERROR: invalid port: {}".format(repr(e))
+            addrinfo = _resolve_address(host, port)
+        except Exception as e:
+            return "ERROR: {}".format(e.strerror if hasattr(e, 'strerror') else repr(e))
 
-        with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
-            sock.settimeout(self.timeout)
+        # like socket.create_connection, try each address in turn so that e.g. an unreachable IPv6 address of a
+        # dual-stack host doesn't hide a reachable IPv4 one
+        error = None
+        for family, socktype, proto, _, sockaddr in addrinfo:
             try:
-                sock.connect((host, port))
+                with closing(socket.socket(family, socktype, proto)) as sock:
+                    sock.settimeout(self.timeout)
+                    sock.connect(sockaddr)
+                return None
             except Exception as e:
-                return "ERROR: {}".format(e.strerror if hasattr(e, 'strerror') else repr(e))
+                error = e
 
-        return None
+        if error is None:
+            return "ERROR: no address found for {}".format(host)
+        return "ERROR: {}".format(error.strerror if hasattr(error, 'strerror') else repr(error))
@@ -175,6 +175,8 @@ class SQLServer(AgentCheck):
     def cancel(self):
         self.statement_metrics.cancel()
         self.activity.cancel()
+        if self.connection is not None:
+            self.connection.close_pool()
 
     def config_checks(self):
         if self.autodiscovery and self.instance.get('database'):
@@ -277,6 +279,9 @@ class SQLServer(AgentCheck):
         return self._agent_hostname
 
     def initialize_connection(self):
+        if self.connection is not None:
+            # the DBM jobs may still be using the connection being replaced, don't let them hand theirs back to its pool
+            self.connection.close_pool()
         self.connection = Connection(self.init_config, self.instance, self.handle_service_check)
 
         # Pre-process the list of metrics to collect
@@ -285,11 +290,16 @@ class SQLServer(AgentCheck):
             db_exists, context = self.connection.check_database()
 
             if db_exists:
+                key_prefixes = self._dbm_connection_key_prefixes()
                 if self.instance.get('stored_procedure') is None:
                     with self.connection.open_managed_default_connection():
                         with self.connection.get_managed_cursor() as cursor:
                             self.autodiscover_databases(cursor)
                         self._make_metric_list_to_collect(self.custom_metrics)
+                else:
+                    # the check's own connection is only opened by its first run
+                    key_prefixes.insert(0, None)
+                self.connection.prewarm_pool(key_prefixes)
             else:
                 # How much do we care that the DB doesn't exist?
                 ignore = is_affirmative(self.instance.get("ignore_missing_database", False))
@@ -311,6 +321,16 @@ class SQLServer(AgentCheck):
         except Exception as e:
             self.log.exception("Initialization exception %s", e)
 
+    def _dbm_connection_key_prefixes(self):
+        """Key prefixes of the connections to the default database used by the enabled DBM jobs"""
+        key_prefixes = []
+        if self.dbm_enabled:
+            if is_affirmative(self.statement_metrics_config.get('enabled', True)):
+                key_prefixes.append(self.statement_metrics._conn_key_prefix)
+            if is_affirmative(self.activity_config.get('enabled', True)):
+                key_prefixes.append(self.activity._conn_key_prefix)
+        return key_prefixes
+
     def handle_service_check(self, status, host, database, message=None, is_default=True):
         custom_tags = self.instance.get("tags", [])
         disable_generic_tags = self.instance.get('disable_generic_tags', False)
@@ -13,6 +13,7 @@ import pytest
 from datadog_checks.dev import WaitFor, docker_run
 from datadog_checks.dev.conditions import CheckDockerLogs
 from datadog_checks.dev.docker import using_windows_containers
+from datadog_checks.sqlserver.connection import _address_cache, _database_list_cache
 
 from .common import (
     DOCKER_SERVER,
@@ -46,6 +47,16 @@ def init_config_alt_tables():
     return deepcopy(INIT_CONFIG_ALT_TABLES)
 
 
+@pytest.fixture(autouse=True)
+def clear_connection_caches():
+    # the database list and resolved addresses are cached at the module level, don't let them leak between tests
+    _database_list_cache.clear()
+    _address_cache.clear()
+    yield
+    _database_list_cache.clear()
+    _address_cache.clear()
+
+
 @pytest.fixture(scope="session")
 def instance_session_default():
     instance = {
@@ -5,15 +5,23 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import os
 import re
+import socket
+from collections import namedtuple
 
 import mock
 import pyodbc
 import pytest
+from cachetools import TTLCache
 
 from datadog_checks.base import ConfigurationError
 from datadog_checks.dev.utils import running_on_windows_ci
 from datadog_checks.sqlserver import SQLServer
-from datadog_checks.sqlserver.connection import Connection, SQLConnectionError, parse_connection_string_properties
+from datadog_checks.sqlserver.connection import (
+    Connection,
+    SQLConnectionError,
+    _format_connection_exception,
+    parse_connection_string_properties,
+)
 
 from .common import CHECK_NAME, SQLSERVER_MAJOR_VERSION
 
@@ -37,6 +45,7 @@ from .common import CHECK_NAME, SQLSERVER_MAJOR_VERSION
         pytest.param('A=B C;', {"A": "B C"}, id="spaces allowed inside a value"),
         pytest.param('A=C ;', {"A": "C "}, id="spaces allowed after a value"),
         pytest.param('A=B ;C=D', {"A": "B ", "C": 'D'}, id="spaces allowed after a value, they become part of it"),
+        pytest.param('A={B;}C{=D};', {"A": "B;C=D"}, id="escaped and regular parts of a value are joined"),
         pytest.param('host=foo;password={pass";{}word}', None, id="escape too early then invalid character"),
         pytest.param('host=foo;password={incomplete_escape;', None, id="incomplete escape"),
         pytest.param('host=foo;password=;', None, id="empty value"),
@@ -53,6 +62,31 @@ def test_parse_connection_string_properties(cs, parsed):
         parse_connection_string_properties(cs)
 
 
+@pytest.mark.unit
+def test_format_connection_exception_redacts_password():
+    e = Exception("Invalid connection string: Server=foo;UID=bob;PWD=s3cr3t;")
+    message = _format_connection_exception(e, redact=('s3cr3t', None))
+    assert 's3cr3t' not in message
+    assert 'PWD=******;' in message
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    'cs,message',
+    [
+        pytest.param('password={abc', "did not find expected matching closing brace", id="unterminated escape"),
+        pytest.param(
+            'password={abc}}', "did not find expected matching closing brace", id="unterminated escape ending in }}"
+        ),
+        pytest.param('{}}}}', "did not find expected matching closing brace", id="unterminated escape of only }}"),
+        pytest.param('password={abc}x}', "invalid character '}' at index=15", id="closing brace after a value"),
+    ],
+)
+def test_parse_connection_string_properties_error_message(cs, message):
+    with pytest.raises(ConfigurationError, match=re.escape(message)):
+        parse_connection_string_properties(cs)
+
+
 @pytest.mark.unit
 @pytest.mark.parametrize(
     'cs,username,password,expect_warning',
@@ -133,6 +167,19 @@ def test_will_fail_for_duplicate_parameters(instance_minimal_defaults, connector
         connection._connection_options_validation('somekey', 'somedb')
 
 
+@pytest.mark.unit
+def test_connection_options_validated_once(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect'), mock.patch.object(
+        connection, '_connection_options_validation'
+    ) as validation:
+        for _ in range(3):
+            with connection.open_managed_default_connection():
+                pass
+    validation.assert_called_once_with(Connection.DEFAULT_DB_KEY, None)
+
+
 @pytest.mark.unit
 @pytest.mark.parametrize(
     'connector, cs',
@@ -162,6 +209,40 @@ def test_will_fail_for_wrong_parameters_in_the_connection_string(instance_minima
         connection._connection_options_validation('somekey', 'somedb')
 
 
+@pytest.mark.unit
+def test_network_connectivity_caches_resolved_address(instance_minimal_defaults):
+    instance_minimal_defaults['host'] = 'sqlserver.example.com,1434'
+    connection = Connection({}, instance_minimal_defaults, None)
+    addrinfo = [
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('fe80::1', 1434, 0, 2)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 1434)),
+    ]
+    sock = mock.MagicMock()
+    sock.connect.side_effect = [socket.error(113, 'No route to host'), None] * 2
+    with mock.patch('socket.getaddrinfo', return_value=addrinfo) as getaddrinfo, mock.patch(
+        'socket.socket', return_value=sock
+    ):
+        for _ in range(2):
+            assert connection.test_network_connectivity() is None
+    getaddrinfo.assert_called_once_with('sqlserver.example.com', 1434, 0, socket.SOCK_STREAM)
+    sock.connect.assert_any_call(('fe80::1', 1434, 0, 2))
+    sock.connect.assert_any_call(('10.0.0.1', 1434))
+
+
+@pytest.mark.unit
+def test_network_connectivity_reports_the_last_error(instance_minimal_defaults):
+    instance_minimal_defaults['host'] = 'sqlserver.example.com,1434'
+    connection = Connection({}, instance_minimal_defaults, None)
+    addrinfo = [
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('fe80::1', 1434, 0, 2)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 1434)),
+    ]
+    sock = mock.MagicMock()
+    sock.connect.side_effect = [socket.error(113, 'No route to host'), socket.error(111, 'Connection refused')]
+    with mock.patch('socket.getaddrinfo', return_value=addrinfo), mock.patch('socket.socket', return_value=sock):
+        assert connection.test_network_connectivity() == "ERROR: Connection refused"
+
+
 @pytest.mark.unit
 @pytest.mark.parametrize(
     'host, port, expected_host',
@@ -197,6 +278,246 @@ def test_config_with_and_without_port(instance_minimal_defaults, host, port, exp
     assert result_host == expected_host
 
 
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    'pooling, expected_connects',
+    [
+        pytest.param(True, 1, id='the idle connection is reused across runs'),
+        pytest.param(False, 3, id='connection pooling is disabled by default'),
+    ],
+)
+def test_connection_pool_reuse(instance_minimal_defaults, pooling, expected_connects):
+    instance_minimal_defaults['connector'] = 'odbc'
+    init_config = {'connection_pooling': True} if pooling else {}
+    connection = Connection(init_config, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        for _ in range(3):
+            with connection.open_managed_default_connection():
+                assert len(connection._conns) == 1
+            assert len(connection._conns) == 0
+    assert connect.call_count == expected_connects
+
+    connection.close_pooled_connections()
+    assert not connection._pool
+
+
+@pytest.mark.unit
+def test_cursor_reused_per_connection(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch(
+        'datadog_checks.sqlserver.connection.pyodbc.connect', side_effect=lambda *a, **kw: mock.MagicMock()
+    ):
+        with connection.open_managed_default_connection():
+            with connection.get_managed_cursor() as cursor:
+                pass
+            with connection.get_managed_cursor() as same_cursor:
+                assert same_cursor is cursor
+            cursor.close.assert_not_called()
+        with connection.open_managed_default_connection():
+            with connection.get_managed_cursor() as new_cursor:
+                assert new_cursor is not cursor
+
+
+@pytest.mark.unit
+def test_cursor_closed_before_connection_is_pooled(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        rawconn = connect.return_value
+        rawconn.cursor.side_effect = lambda: mock.MagicMock()
+        with connection.open_managed_default_connection():
+            with connection.get_managed_cursor() as cursor:
+                cursor.fetchone()
+        # pending results left on the reused cursor must not keep the pooled connection busy
+        cursor.close.assert_called_once()
+        assert not connection._cursors
+
+        with connection.open_managed_default_connection():
+            with connection.get_managed_cursor() as new_cursor:
+                assert new_cursor is not cursor
+    assert connect.call_count == 1
+
+
+@pytest.mark.unit
+def test_close_pool(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        with connection.open_managed_default_connection(key_prefix='dbm-'):
+            pass
+        pooled = connect.return_value
+        pooled.close.side_effect = Exception("already closed")
+        connect.return_value = mock.MagicMock()
+        with connection.open_managed_default_connection():
+            in_use = connect.return_value
+
+            connection.close_pool()
+
+            pooled.close.assert_called_once()
+            # a connection still in use, i.e. by a DBM job, is only closed once it is released
+            in_use.close.assert_not_called()
+        in_use.close.assert_called_once()
+    assert not connection._conns
+    assert not connection._pool
+
+
+@pytest.mark.unit
+def test_prewarm_pool(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch(
+        'datadog_checks.sqlserver.connection.pyodbc.connect', side_effect=lambda *a, **kw: mock.MagicMock()
+    ) as connect:
+        connection.prewarm_pool([None, 'dbm-'])
+        for thread in connection._prewarm_threads:
+            thread.join()
+        assert connect.call_count == 2
+        assert len(connection._pool) == 2
+
+        # the check run and the DBM job borrow the prewarmed connections
+        with connection.open_managed_default_connection():
+            pass
+        with connection.open_managed_default_connection(key_prefix='dbm-'):
+            pass
+        assert connect.call_count == 2
+
+
+@pytest.mark.unit
+def test_prewarm_pool_disabled(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        connection.prewarm_pool([None])
+    assert not connection._prewarm_threads
+    connect.assert_not_called()
+
+
+@pytest.mark.unit
+def test_prewarm_pool_after_pool_closed(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        connection.prewarm_pool([None])
+        connection.close_pool()
+        for thread in connection._prewarm_threads:
+            thread.join()
+    # a connection opened after the pool has been closed is not kept around
+    assert not connection._pool
+    if connect.called:
+        connect.return_value.close.assert_called_once()
+
+
+@pytest.mark.unit
+def test_prewarm_pool_redacts_password(instance_minimal_defaults):
+    instance_minimal_defaults.update({'connector': 'odbc', 'password': 'Sup3rS3cr3t'})
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    connection.log = mock.MagicMock()
+    with mock.patch(
+        'datadog_checks.sqlserver.connection.pyodbc.connect',
+        side_effect=Exception("Login failed, PWD=Sup3rS3cr3t"),
+    ):
+        connection.prewarm_pool([None])
+        for thread in connection._prewarm_threads:
+            thread.join()
+    assert not connection._pool
+    message, formatted_exception = connection.log.debug.call_args[0]
+    assert message == "Could not open a connection to prewarm the pool: %s"
+    assert 'Sup3rS3cr3t' not in formatted_exception
+
+
+@pytest.mark.unit
+def test_pooled_connection_database_context_is_reset(instance_minimal_defaults):
+    instance_minimal_defaults.update({'connector': 'odbc', 'database': 'my]db'})
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        for _ in range(2):
+            with connection.open_managed_default_connection():
+                pass
+    cursor = connect.return_value.cursor.return_value.__enter__.return_value
+    cursor.execute.assert_called_with("USE [my]]db]")
+
+
+@pytest.mark.unit
+def test_default_database_connection_is_not_pooled(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        with connection.open_managed_default_database():
+            pass
+    connect.return_value.close.assert_called_once()
+    assert not connection._conns
+    assert not connection._pool
+
+
+@pytest.mark.unit
+def test_odbc_isolation_level_set_as_connection_attribute(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        with connection.open_managed_default_connection():
+            pass
+    rawconn = connect.return_value
+    rawconn.set_attr.assert_called_once_with(pyodbc.SQL_ATTR_TXN_ISOLATION, pyodbc.SQL_TXN_READ_UNCOMMITTED)
+    rawconn.cursor.assert_not_called()
+
+
+@pytest.mark.unit
+def test_connection_pool_discards_dead_connections(instance_minimal_defaults):
+    instance_minimal_defaults['connector'] = 'odbc'
+    connection = Connection({'connection_pooling': True}, instance_minimal_defaults, mock.MagicMock())
+    with mock.patch('datadog_checks.sqlserver.connection.pyodbc.connect') as connect:
+        with connection.open_managed_default_connection():
+            pass
+        dead_conn = connect.return_value
+        dead_conn.cursor.side_effect = Exception("connection is broken")
+        connect.return_value = mock.MagicMock()
+        with connection.open_managed_default_connection():
+            pass
+    assert connect.call_count == 2
+    dead_conn.close.assert_called_once()
+
+
+@pytest.mark.unit
+def test_database_list_is_shared_between_connections(instance_minimal_defaults):
+    Row = namedtuple('Row', 'name,collation_name')
+    cursor = mock.MagicMock()
+    cursor.fetchall.return_value = [Row('master', 'SQL_Latin1_General_CP1_CI_AS')]
+
+    cache = TTLCache(maxsize=10, ttl=60)
+    with mock.patch('datadog_checks.sqlserver.connection._database_list_cache', cache):
+        with mock.patch('datadog_checks.sqlserver.connection.Connection.get_cursor', return_value=cursor):
+            for _ in range(2):
+                db_exists, _ = Connection({}, instance_minimal_defaults, None)._check_db_exists()
+                assert db_exists
+            assert cursor.execute.call_count == 1
+            # the cache is shared by all instances, the password must never be part of its keys
+            assert all(instance_minimal_defaults['password'] not in str(key) for key in cache)
+
+            # a missing database invalidates the cached list so that the next check queries the server again
+            instance_minimal_defaults['database'] = 'missing'
+            for _ in range(2):
+                db_exists, _ = Connection({}, instance_minimal_defaults, None)._check_db_exists()
+                assert not db_exists
+            assert cursor.execute.call_count == 2
+
+
+@pytest.mark.unit
+def test_database_list_is_not_shared_between_connection_string_servers(instance_minimal_defaults):
+    Row = namedtuple('Row', 'name,collation_name')
+    del instance_minimal_defaults['host']
+    cursor_a, cursor_b = mock.MagicMock(), mock.MagicMock()
+    cursor_a.fetchall.return_value = [Row('only_on_a', 'SQL_Latin1_General_CP1_CI_AS')]
+    cursor_b.fetchall.return_value = [Row('only_on_b', 'SQL_Latin1_General_CP1_CI_AS')]
+
+    for server, cursor in (('server-a', cursor_a), ('server-b', cursor_b)):
+        instance = dict(instance_minimal_defaults, connection_string='Server={};'.format(server), database='only_on_a')
+        with mock.patch('datadog_checks.sqlserver.connection.Connection.get_cursor', return_value=cursor):
+            db_exists, _ = Connection({}, instance, None)._check_db_exists()
+        assert db_exists is (server == 'server-a')
+        cursor.execute.assert_called_once()
+
+
 @pytest.mark.integration
 @pytest.mark.usefixtures('dd_environment')
 @pytest.mark.skipif(running_on_windows_ci() and SQLSERVER_MAJOR_VERSION == 2019, reason='Test flakes on this set up')
@@ -39,7 +39,8 @@ def test_get_cursor(instance_docker):
         check.connection.get_cursor('foo')
 
 
-def test_missing_db(instance_docker, dd_run_check):
+@mock.patch('datadog_checks.sqlserver.connection.Connection.prewarm_pool')
+def test_missing_db(prewarm_pool, instance_docker, dd_run_check):
     instance = copy.copy(instance_docker)
     instance['ignore_missing_database'] = False
     with mock.patch('datadog_checks.sqlserver.connection.Connection.check_database', return_value=(False, 'db')):
@@ -53,11 +54,14 @@ def test_missing_db(instance_docker, dd_run_check):
         check.initialize_connection()
         dd_run_check(check)
         assert check.do_check is False
+    # the pool is only prewarmed once the database is known to exist
+    prewarm_pool.assert_not_called()
 
 
+@mock.patch('datadog_checks.sqlserver.connection.Connection.prewarm_pool')
 @mock.patch('datadog_checks.sqlserver.connection.Connection.open_managed_default_database')
 @mock.patch('datadog_checks.sqlserver.connection.Connection.get_cursor')
-def test_db_exists(get_cursor, mock_connect, instance_docker_defaults, dd_run_check):
+def test_db_exists(get_cursor, mock_connect, prewarm_pool, instance_docker_defaults, dd_run_check):
     Row = namedtuple('Row', 'name,collation_name')
     db_results = [
         Row('master', 'SQL_Latin1_General_CP1_CI_AS'),
@@ -70,7 +74,7 @@ def test_db_exists(get_cursor, mock_connect, instance_docker_defaults, dd_run_ch
     mock_connect.__enter__ = mock.Mock(return_value='foo')
 
     mock_results = mock.MagicMock()
-    mock_results.__iter__.return_value = db_results
+    mock_results.fetchall.return_value = db_results
     get_cursor.return_value = mock_results
 
     instance = copy.copy(instance_docker_defaults)
@@ -81,6 +85,7 @@ def test_db_exists(get_cursor, mock_connect, instance_docker_defaults, dd_run_ch
     check = SQLServer(CHECK_NAME, {}, [instance])
     check.initialize_connection()
     assert check.do_check is True
+    prewarm_pool.assert_called_once_with([None])
 
     # check all caps for case insensitive db
     instance['database'] = 'MASTER'
@@ -103,8 +108,10 @@ def test_db_exists(get_cursor, mock_connect, instance_docker_defaults, dd_run_ch
     # check case sensitive but mismatched db
     instance['database'] = 'cASEsENSITIVE2018'
     check = SQLServer(CHECK_NAME, {}, [instance])
+    prewarm_pool.reset_mock()
     with pytest.raises(ConfigurationError):
         check.initialize_connection()
+    prewarm_pool.assert_not_called()
 
     # check offline but exists db
     instance['database'] = 'Offlinedb'
@@ -113,6 +120,38 @@ def test_db_exists(get_cursor, mock_connect, instance_docker_defaults, dd_run_ch
     assert check.do_check is True
 
 
+@mock.patch('datadog_checks.sqlserver.connection.Connection.prewarm_pool')
+@mock.patch('datadog_checks.sqlserver.connection.Connection.open_managed_default_database')
+@mock.patch('datadog_checks.sqlserver.connection.Connection.get_cursor')
+def test_db_exists_case_sensitive_collision(get_cursor, mock_connect, prewarm_pool, instance_docker_defaults):
+    Row = namedtuple('Row', 'name,collation_name')
+    # two databases whose names only differ by case can coexist on a case-sensitive server
+    db_results = [
+        Row('master', 'SQL_Latin1_General_CP1_CI_AS'),
+        Row('Foo', 'SQL_Latin1_General_CP1_CS_AS'),
+        Row('foo', 'SQL_Latin1_General_CP1_CS_AS'),
+    ]
+
+    mock_results = mock.MagicMock()
+    mock_results.fetchall.return_value = db_results
+    get_cursor.return_value = mock_results
+
+    instance = copy.copy(instance_docker_defaults)
+    # make sure check doesn't try to add metrics
+    instance['stored_procedure'] = 'fake_proc'
+
+    for database in ('Foo', 'foo'):
+        instance['database'] = database
+        check = SQLServer(CHECK_NAME, {}, [instance])
+        check.initialize_connection()
+        assert check.do_check is True
+
+    instance['database'] = 'FOO'
+    check = SQLServer(CHECK_NAME, {}, [instance])
+    with pytest.raises(ConfigurationError):
+        check.initialize_connection()
+
+
 def test_autodiscovery_matches_all_by_default(instance_autodiscovery):
     fetchall_results, mock_cursor = _mock_database_list()
     all_dbs = set([r.name for r in fetchall_results])